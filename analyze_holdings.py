@@ -1,7 +1,103 @@
 import pandas as pd
+import codecs
 import glob
+import hashlib
 import os
+import pickle
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# 解析后的单基金持仓数据缓存目录
+CACHE_DIR = 'cache'
+# 合并后的股票分类字典缓存，随分类表的修改时间失效
+STOCK_CATEGORIES_CACHE = os.path.join(CACHE_DIR, 'stock_categories.pkl')
+
+# 不同来源 CSV 的列名差异统一映射到标准列名
+COLUMN_MAPPING = {
+    '占净值 比例': '占净值比例',
+    '占净值比例': '占净值比例',
+    '持仓市值 （万元）': '持仓市值',
+    '持仓市值': '持仓市值',
+    '市值': '持仓市值',
+    '持仓市值 （万元人民币）': '持仓市值',
+    '股票名称': '股票名称',
+    '股票代码': '股票代码',
+    '季度': '季度'
+}
+
+REQUIRED_COLUMNS = ['股票代码', '股票名称', '占净值比例', '持仓市值', '季度']
+
+# 未加载到分类表时，按股票代码前三位划分板块
+SECTOR_MAPPING = {
+    '688': '科创板', '300': '创业板', '002': '中小板',
+    '000': '主板', '600': '主板', '601': '主板',
+    '603': '主板', '605': '主板', '005': '主板', '006': '主板',
+}
+
+# 数值列中的百分号和千分位逗号，一次正则替换全部去除
+_NUMERIC_NOISE_RE = re.compile(r'[%,，]')
+
+# 报告中固定不变的段落模板：每段作为一个整体写入报告行列表，需要参数的用 str.format 一次填充
+OVERVIEW_HEADER = "# 所有基金持仓总览\n---\n### 整体行业偏好"
+OVERVIEW_UNCLASSIFIED_HEADER = (
+    "\n### 未分类股票列表（按总市值汇总）\n---\n"
+    "| 股票代码 | 股票名称 | 持仓市值 |\n"
+    "|---|---|---|"
+)
+FUND_REPORT_HEADER = "## 基金代码: {fund_code} 持仓分析报告\n---"
+FUND_UNCLASSIFIED_HEADER = "\n### 未能匹配到行业分类的股票列表\n---"
+SECTOR_SECTION_HEADER = "\n### 2. 行业偏好和持仓集中度\n#### 行业偏好（占净值比例之和）"
+SECTOR_TABLE_HEADER = "| 季度 | 行业 | 占比 | 进度条 |\n|---|---|---|---|"
+CONCENTRATION_TABLE_HEADER = (
+    "\n#### 前十大持仓集中度（占净值比例之和）\n"
+    "| 季度 | 占净值比例 | 进度条 |\n"
+    "|---|---|---|"
+)
+TREND_SECTION_HEADER = (
+    "\n### 3. 趋势总结和投资建议\n"
+    "> **免责声明**：本报告基于历史持仓数据进行分析，不构成任何投资建议。投资有风险，入市需谨慎。\n"
+    "\n基于对基金 **{fund_code}** 的历史持仓数据分析，本报告得出以下关键观察结果："
+)
+TREND_SECTION_FOOTER = (
+    "\n**总结与建议：**\n"
+    "  在考虑投资该基金时，建议将上述分析结果与其他因素结合考量，例如基金的过往业绩、基金经理的管理经验、基金规模以及费率等。"
+)
+
+# 持仓文件名形如 持仓_<基金代码>_<年份>.csv，取第一个下划线后的字段作为基金代码
+_FUND_FILE_RE = re.compile(r'[^_]*_(?P<fund_code>[^_]*)')
+
+# Windows 上 ProcessPoolExecutor 的 max_workers 不能超过 61
+_MAX_POOL_WORKERS = 61
+
+def _detect_encoding(path, sample_size=65536):
+    """
+    读取文件开头的字节样本判断编码：优先识别 BOM，其次尝试 UTF-8，失败则按 GBK 处理。
+    """
+    with open(path, 'rb') as fh:
+        sample = fh.read(sample_size)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    elif sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    else:
+        try:
+            sample.decode('utf-8')
+            encoding = 'utf-8'
+        except UnicodeDecodeError as e:
+            # 样本末尾可能截断了一个多字节字符，这种情况仍视为 UTF-8
+            encoding = 'utf-8' if e.reason == 'unexpected end of data' else 'gbk'
+
+    return encoding
+
+def safe_read_csv(path, **kwargs):
+    """
+    按探测到的编码读取 CSV，只解析一次文件，避免逐个编码重试。
+    默认使用 C 解析引擎并以内存映射方式读取文件。
+    """
+    kwargs.setdefault('memory_map', True)
+    return pd.read_csv(path, encoding=_detect_encoding(path), **kwargs)
 
 def load_stock_categories(category_path):
     """
@@ -20,68 +116,83 @@ def load_stock_categories(category_path):
         print(f"未在 '{category_path}' 目录中找到任何 XLSX 文件。")
         return all_categories
 
+    # 分类表未变化时直接复用上次解析结果，跳过缓慢的 Excel 读取
+    signature = sorted((f, os.path.getmtime(f)) for f in xlsx_files)
+    if os.path.exists(STOCK_CATEGORIES_CACHE):
+        try:
+            with open(STOCK_CATEGORIES_CACHE, 'rb') as fh:
+                cached = pickle.load(fh)
+            if cached['signature'] == signature:
+                return cached['categories']
+        except Exception as e:
+            print(f"读取分类缓存 {STOCK_CATEGORIES_CACHE} 时出错，将重新解析: {e}")
+
     for f in xlsx_files:
         try:
             category_name = os.path.basename(f).split('.')[0].replace('分类表', '')
             
-            df = pd.read_excel(f, header=0, engine='openpyxl')
+            # 只解析需要的两列，股票代码直接按字符串读入
+            df = pd.read_excel(f, header=0, engine='openpyxl',
+                               usecols=lambda col: col in ('股票代码', '股票名称'),
+                               dtype={'股票代码': str})
             
             if '股票代码' not in df.columns or '股票名称' not in df.columns:
                 print(f"文件 {f} 缺少关键列 '股票代码' 或 '股票名称'，跳过。")
                 continue
             
-            df['股票代码'] = df['股票代码'].astype(str).str.strip().str.zfill(6)
+            df['股票代码'] = df['股票代码'].str.strip().str.zfill(6)
             
-            for code in df['股票代码']:
-                all_categories[code] = category_name
+            # 每个文件只有一个分类名，一次性构建字典再合并，后读到的文件覆盖先前的分类
+            all_categories |= dict.fromkeys(df['股票代码'].tolist(), category_name)
         except Exception as e:
             print(f"读取分类文件 {f} 时出错: {e}")
             continue
+
+    if all_categories:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # 先写临时文件再原子替换，运行中断也不会留下截断的缓存
+        tmp_path = f"{STOCK_CATEGORIES_CACHE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as fh:
+            pickle.dump({'signature': signature, 'categories': all_categories}, fh)
+        os.replace(tmp_path, STOCK_CATEGORIES_CACHE)
             
     return all_categories
 
-def generate_fund_report(df, fund_code, report):
-    """
-    为单个基金生成详细分析报告。
+def generate_stock_changes_section(df, quarters, holdings_by_quarter):
     """
-    report.append(f"## 基金代码: {fund_code} 持仓分析报告")
-    report.append("---")
-    
-    unclassified_stocks = df[df['行业'].str.contains('未分类')]
-    if not unclassified_stocks.empty:
-        report.append("\n### 未能匹配到行业分类的股票列表")
-        report.append("---")
-        for quarter, group in unclassified_stocks.groupby('季度'):
-            report.append(f"#### {quarter}")
-            for index, row in group.iterrows():
-                report.append(f"- **{row['股票名称']}** ({row['股票代码']}): 占净值比例 {row['占净值比例']:.2f}%")
-        report.append("---\n")
+    生成重仓股在相邻季度之间的新增、移除和增减持变动。
 
+    Args:
+        df (pd.DataFrame): 单个基金的持仓数据。
+        quarters (list): 按时间先后排列的季度标签。
+        holdings_by_quarter (dict): 季度 -> 以股票代码为索引的该季度持仓（股票名称、占净值比例）。
+    """
+    report = []
     report.append("### 1. 重仓股变动")
-    quarters = df['季度'].unique()
     if len(quarters) > 1:
+        # 一次分组得到每只股票在各季度是否持有，相邻季度的增删由布尔列运算得出
+        presence = df.groupby(['股票代码', '季度'], observed=True).size().unstack(fill_value=0).astype(bool)
         for i in range(len(quarters) - 1):
             current_q = quarters[i]
             next_q = quarters[i+1]
             
-            current_holdings = df[df['季度'] == current_q][['股票代码', '股票名称', '占净值比例']].set_index('股票代码')
-            next_holdings = df[df['季度'] == next_q][['股票代码', '股票名称', '占净值比例']].set_index('股票代码')
+            current_holdings = holdings_by_quarter[current_q]
+            next_holdings = holdings_by_quarter[next_q]
             
-            new_additions = next_holdings.index.difference(current_holdings.index)
-            removed = current_holdings.index.difference(next_holdings.index)
+            new_additions = presence.index[~presence[current_q] & presence[next_q]]
+            removed = presence.index[presence[current_q] & ~presence[next_q]]
             
             report.append(f"#### 从 {current_q} 到 {next_q} 的变动")
+            # 按代码批量取出新增/移除股票的行，一次索引查找代替逐个 .loc
             if not new_additions.empty:
                 report.append("- **新增股票**：")
-                for code in new_additions:
-                    stock_name = next_holdings.loc[code, '股票名称']
-                    ratio = next_holdings.loc[code, '占净值比例']
+                added = next_holdings.loc[new_additions]
+                for code, stock_name, ratio in zip(added.index, added['股票名称'], added['占净值比例']):
                     report.append(f"  - **{stock_name}** ({code}): 占净值比例 {ratio:.2f}%")
             if not removed.empty:
                 report.append("- **移除股票**：")
-                for code in removed:
-                    stock_name = current_holdings.loc[code, '股票名称']
-                    ratio = current_holdings.loc[code, '占净值比例']
+                dropped = current_holdings.loc[removed]
+                for code, stock_name, ratio in zip(dropped.index, dropped['股票名称'], dropped['占净值比例']):
                     report.append(f"  - **{stock_name}** ({code}): 占净值比例 {ratio:.2f}%")
 
             common_stocks = current_holdings.index.intersection(next_holdings.index)
@@ -96,51 +207,64 @@ def generate_fund_report(df, fund_code, report):
                     if abs(diff) > 0.5:
                         action = "增持" if diff > 0 else "减持"
                         report.append(f"  - **{name}** ({code}): **{action}**，比例从 {current_ratio:.2f}% 变为 {next_ratio:.2f}% (变化 {diff:+.2f}%)")
+    return report
 
-    report.append("\n### 2. 行业偏好和持仓集中度")
-    sector_summary = df.groupby(['季度', '行业'])['占净值比例'].sum().unstack(fill_value=0)
-    
-    sector_summary = sector_summary.loc[:, ~sector_summary.columns.str.contains('未分类')]
-    sector_summary = sector_summary.loc[:, (sector_summary != 0).any(axis=0)]
-    sector_summary = sector_summary.astype(float)
-    
-    report.append("#### 行业偏好（占净值比例之和）")
+def _progress_bars(ratios):
+    """
+    按占净值比例生成文本进度条，每 5% 一格。
+    """
+    return pd.Series('█', index=ratios.index).str.repeat((ratios / 5).astype(int).tolist())
+
+def generate_sector_analysis_section(sector_summary, concentration_summary):
+    """
+    生成行业偏好和持仓集中度表格。
+
+    Args:
+        sector_summary (pd.DataFrame): 按季度汇总的各行业占净值比例（已剔除未分类行业）。
+        concentration_summary (pd.Series): 按季度汇总的持仓占净值比例之和。
+    """
+    report = [SECTOR_SECTION_HEADER]
     if not sector_summary.empty:
-        report.append("| 季度 | 行业 | 占比 | 进度条 |")
-        report.append("|---|---|---|---|")
-        for quarter, row in sector_summary.iterrows():
-            sorted_sectors = row.sort_values(ascending=False)
-            for sector, ratio in sorted_sectors.items():
-                if ratio > 0:
-                    progress_bar = '█' * int(ratio / 5)
-                    report.append(f"| {quarter} | {sector} | {ratio:.2f}% | {progress_bar} |")
+        report.append(SECTOR_TABLE_HEADER)
+        # 转为长表后按季度顺序、占比降序排列，整列拼接表格行，避免逐行 iterrows
+        sector_long = sector_summary.stack().rename('占比').reset_index()
+        sector_long = sector_long[sector_long['占比'] > 0]
+        sector_long['季度序号'] = sector_summary.index.get_indexer(sector_long['季度'])
+        sector_long = sector_long.sort_values(['季度序号', '占比'], ascending=[True, False], kind='stable')
+        report.extend(('| ' + sector_long['季度'].astype(str) + ' | ' + sector_long['行业'].astype(str) + ' | '
+                       + sector_long['占比'].map('{:.2f}'.format) + '% | '
+                       + _progress_bars(sector_long['占比']) + ' |').tolist())
     else:
         report.append("无行业偏好数据可供分析。")
 
-    concentration_summary = df.groupby('季度')['占净值比例'].sum()
+    report.append(CONCENTRATION_TABLE_HEADER)
+    report.extend(('| ' + concentration_summary.index.astype(str) + ' | '
+                   + concentration_summary.map('{:.2f}'.format).to_numpy() + '% | '
+                   + _progress_bars(concentration_summary).to_numpy() + ' |').tolist())
+    return report
+
+def generate_trend_summary_section(fund_code, sector_summary, concentration_summary):
+    """
+    根据集中度和行业偏好的首尾变化生成趋势总结。
+    """
+    report = [TREND_SECTION_HEADER.format(fund_code=fund_code)]
     
-    report.append("\n#### 前十大持仓集中度（占净值比例之和）")
-    report.append("| 季度 | 占净值比例 | 进度条 |")
-    report.append("|---|---|---|")
-    for quarter, ratio in concentration_summary.items():
-        progress_bar = '█' * int(ratio / 5)
-        report.append(f"| {quarter} | {ratio:.2f}% | {progress_bar} |")
-
-    report.append("\n### 3. 趋势总结和投资建议")
-    report.append("> **免责声明**：本报告基于历史持仓数据进行分析，不构成任何投资建议。投资有风险，入市需谨慎。")
-    report.append(f"\n基于对基金 **{fund_code}** 的历史持仓数据分析，本报告得出以下关键观察结果：")
+    # 只有一个季度时无从比较首尾变化，直接结束趋势分析
+    if len(concentration_summary) < 2:
+        report.append("- **数据不足**：该基金仅有一个季度的持仓数据，无法分析持仓集中度和行业偏好的变化。")
+        report.append(TREND_SECTION_FOOTER)
+        return report
+
+    first_concentration = concentration_summary.iloc[0]
+    last_concentration = concentration_summary.iloc[-1]
+    concentration_diff = last_concentration - first_concentration
     
-    if len(concentration_summary) > 1:
-        first_concentration = concentration_summary.iloc[0]
-        last_concentration = concentration_summary.iloc[-1]
-        concentration_diff = last_concentration - first_concentration
-        
-        if concentration_diff > 10:
-            report.append("- **持仓集中度**：在分析期内，该基金的持仓集中度显著**上升**，表明基金经理正将资金集中到少数看好股票上。")
-        elif concentration_diff < -10:
-            report.append("- **持仓集中度**：在分析期内，该基金的持仓集中度显著**下降**，表明基金经理正在分散投资以降低风险。")
-        else:
-            report.append("- **持仓集中度**：该基金的持仓集中度在分析期内相对**稳定**，可能反映其投资风格稳健。")
+    if concentration_diff > 10:
+        report.append("- **持仓集中度**：在分析期内，该基金的持仓集中度显著**上升**，表明基金经理正将资金集中到少数看好股票上。")
+    elif concentration_diff < -10:
+        report.append("- **持仓集中度**：在分析期内，该基金的持仓集中度显著**下降**，表明基金经理正在分散投资以降低风险。")
+    else:
+        report.append("- **持仓集中度**：该基金的持仓集中度在分析期内相对**稳定**，可能反映其投资风格稳健。")
 
     if not sector_summary.empty and len(sector_summary.index) > 1:
         first_quarter_summary = sector_summary.iloc[0]
@@ -157,8 +281,167 @@ def generate_fund_report(df, fund_code, report):
         except ValueError:
             report.append("- **行业偏好**：由于数据不足，无法分析行业偏好变化。")
     
-    report.append("\n**总结与建议：**")
-    report.append("  在考虑投资该基金时，建议将上述分析结果与其他因素结合考量，例如基金的过往业绩、基金经理的管理经验、基金规模以及费率等。")
+    report.append(TREND_SECTION_FOOTER)
+    return report
+
+def generate_fund_report(df, fund_code):
+    """
+    为单个基金生成详细分析报告。
+
+    Returns:
+        list: 该基金报告的所有行，由调用方逐个基金写入文件。
+    """
+    report = [FUND_REPORT_HEADER.format(fund_code=fund_code)]
+    
+    unclassified_stocks = df[df['行业'].str.contains('未分类', regex=False)]
+    if not unclassified_stocks.empty:
+        report.append(FUND_UNCLASSIFIED_HEADER)
+        # 整列拼接出每只股票的列表行，再按季度分组输出，避免逐行 iterrows
+        lines = ('- **' + unclassified_stocks['股票名称'].astype(str) + '** (' + unclassified_stocks['股票代码']
+                 + '): 占净值比例 ' + unclassified_stocks['占净值比例'].map('{:.2f}'.format) + '%')
+        for quarter, quarter_lines in lines.groupby(unclassified_stocks['季度'], observed=True):
+            report.append(f"#### {quarter}")
+            report.extend(quarter_lines)
+        report.append("---\n")
+
+    # 按季度只分组一次：各季度持仓切片和集中度汇总都由同一个分组得到，供各部分共用。
+    # 季度为有序分类类型，分组结果已按时间先后排列
+    quarter_groups = df.groupby('季度', observed=True)
+    holdings_by_quarter = {
+        quarter: group[['股票代码', '股票名称', '占净值比例']].set_index('股票代码')
+        for quarter, group in quarter_groups
+    }
+    concentration_summary = quarter_groups['占净值比例'].sum()
+    quarters = concentration_summary.index.tolist()
+
+    report.extend(generate_stock_changes_section(df, quarters, holdings_by_quarter))
+
+    # 行业汇总只计算一次，供第 2、3 部分共用
+    sector_summary = df.groupby(['季度', '行业'], observed=True)['占净值比例'].sum().unstack(fill_value=0)
+    sector_summary = sector_summary.loc[:, ~sector_summary.columns.str.contains('未分类', regex=False)]
+    sector_summary = sector_summary.loc[:, (sector_summary != 0).any(axis=0)]
+    sector_summary = sector_summary.astype(float)
+
+    report.extend(generate_sector_analysis_section(sector_summary, concentration_summary))
+    report.extend(generate_trend_summary_section(fund_code, sector_summary, concentration_summary))
+    return report
+
+def preprocess_fund_data(df):
+    """
+    统一单个持仓 CSV 的列名，并将比例、市值转换为数值、股票代码补齐为 6 位。
+    调用方需以字符串类型读入股票代码（dtype={'股票代码': str}），此处不再重复转换。
+
+    Raises:
+        KeyError: 缺少必需的列时抛出。
+    """
+    df.columns = [COLUMN_MAPPING.get(col, col) for col in df.columns]
+
+    missing_cols = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_cols:
+        raise KeyError(f"缺少关键列 {missing_cols}")
+
+    for col in ['占净值比例', '持仓市值']:
+        # 解析时已是数值的列（如不带单位的持仓市值）无需再转字符串清洗
+        if pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        df[col] = pd.to_numeric(df[col].astype(str).str.replace(_NUMERIC_NOISE_RE, '', regex=True), errors='coerce')
+
+    df['股票代码'] = df['股票代码'].str.strip().str.zfill(6)
+    return df
+
+def assign_industry(df, stock_categories):
+    """
+    为合并后的全部持仓一次性映射行业：有分类表时按股票代码查表，
+    否则按代码前三位映射板块，均未命中的记为 '未分类'。
+    """
+    # 同一股票在多个季度、多个基金中反复出现：只对去重后的代码查表，再按编码映射回各行
+    codes, unique_codes = pd.factorize(df['股票代码'], use_na_sentinel=False)
+    unique_codes = pd.Series(unique_codes)
+    if stock_categories:
+        industry = unique_codes.map(stock_categories)
+    else:
+        industry = unique_codes.str[:3].map(SECTOR_MAPPING)
+    df['行业'] = industry.fillna('未分类').to_numpy()[codes]
+    return df
+
+def get_fund_cache_path(fund_code, input_files):
+    """
+    根据输入文件的路径、修改时间和大小计算单基金缓存文件路径。
+    任一输入文件变化都会得到新的缓存键，旧缓存自然失效。
+    """
+    signature = repr(sorted((f, os.path.getmtime(f), os.path.getsize(f)) for f in input_files))
+    key = hashlib.md5(signature.encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, f"{fund_code}_{key}.pkl")
+
+def process_temporal_data(df):
+    """
+    将 '2023年1季度' 形式的季度标签规范为 '2023-Q1季度'，并解析出年份和季度编号。
+    季度列转为按时间先后排序的有序分类类型，分组和取类别时直接得到时间顺序，
+    无需再对整表或去重后的季度排序。
+    """
+    # 缺少季度的行无法归入任何时间段：先剔除，否则 factorize 的 -1 编码会把它们映射成最后一个季度
+    missing = df['季度'].isna()
+    if missing.any():
+        print(f"有 {missing.sum()} 行持仓缺少季度信息，已跳过。")
+        df = df[~missing].reset_index(drop=True)
+
+    # 季度标签只有少数几种取值：只对去重后的标签做字符串处理，再按编码映射回各行
+    codes, labels = pd.factorize(df['季度'])
+    labels = pd.Series(labels).str.replace('年', '-Q')
+    # 一次正则扫描同时取出年份和季度编号
+    parts = labels.str.extract(r'(?P<年份>\d{4})-Q(?P<季度编号>\d)').astype(int)
+    chronological = labels.iloc[parts.sort_values(['年份', '季度编号'], kind='stable').index].drop_duplicates()
+    df['季度'] = pd.Categorical(labels.to_numpy()[codes], categories=chronological, ordered=True)
+    df['年份'] = parts['年份'].to_numpy()[codes]
+    df['季度编号'] = parts['季度编号'].to_numpy()[codes]
+    return df
+
+def load_fund_holdings(fund_code, files, cache_path):
+    """
+    读取并合并单个基金的全部持仓 CSV，命中缓存时直接返回缓存数据。
+    作为独立函数以便在子进程中执行；季度解析和行业映射由调用方对全部基金统一处理。
+
+    Returns:
+        pd.DataFrame or None: 合并后的持仓数据，所有文件都读取失败时返回 None。
+    """
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_pickle(cache_path)
+        except Exception as e:
+            print(f"读取基金缓存 {cache_path} 时出错，将重新解析: {e}")
+
+    df_list = []
+    for f in files:
+        try:
+            # 只解析能映射到标准列名的列，序号、相关资讯、持股数等列在读取时直接跳过
+            df = safe_read_csv(f, usecols=lambda col: col in COLUMN_MAPPING, dtype={'股票代码': str})
+            df = preprocess_fund_data(df)
+            df['基金代码'] = fund_code
+            df_list.append(df)
+        except KeyError as e:
+            print(f"读取文件 {f} 时出错：缺少关键列 {e}")
+            continue
+        except Exception as e:
+            print(f"读取文件 {f} 时出错：{e}")
+            continue
+
+    if not df_list:
+        return None
+
+    combined_df = pd.concat(df_list, ignore_index=True)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # 先写临时文件再原子替换，进程中途被终止也不会留下截断的缓存
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    combined_df.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+    # 输入文件变化后旧缓存键不会再命中，删除该基金的其余缓存，避免缓存目录无限增长
+    for stale_path in glob.glob(os.path.join(CACHE_DIR, f"{glob.escape(fund_code)}_*.pkl")):
+        if stale_path != cache_path:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+    return combined_df
 
 def analyze_holdings():
     """
@@ -176,105 +459,64 @@ def analyze_holdings():
     stock_categories = load_stock_categories(category_path)
     if not stock_categories:
         print("未加载到任何股票分类数据，将使用默认板块分析。")
-        sector_mapping = {
-            '688': '科创板', '300': '创业板', '002': '中小板',
-            '000': '主板', '600': '主板', '601': '主板',
-            '603': '主板', '605': '主板', '005': '主板', '006': '主板',
-        }
-        use_detailed_categories = False
-    else:
-        use_detailed_categories = True
 
-    all_funds_df_list = []
     fund_files = {}
     for f in all_files:
-        try:
-            fund_code = os.path.basename(f).split('_')[1]
-            if fund_code not in fund_files:
-                fund_files[fund_code] = []
-            fund_files[fund_code].append(f)
-        except IndexError:
+        match = _FUND_FILE_RE.match(os.path.basename(f))
+        if not match:
             print(f"文件名格式不正确，跳过：{f}")
             continue
+        fund_files.setdefault(match['fund_code'], []).append(f)
 
     if not fund_files:
         print("未找到任何有效基金文件。")
         return
 
-    for fund_code, files in fund_files.items():
-        df_list = []
-        for f in files:
-            try:
-                df = pd.read_csv(f, engine='python')
-                
-                column_mapping = {
-                    '占净值 比例': '占净值比例', 
-                    '占净值比例': '占净值比例',
-                    '持仓市值 （万元）': '持仓市值',
-                    '持仓市值': '持仓市值',
-                    '市值': '持仓市值',
-                    '持仓市值 （万元人民币）': '持仓市值',
-                    '股票名称': '股票名称',
-                    '股票代码': '股票代码',
-                    '季度': '季度'
-                }
-                
-                df.columns = [column_mapping.get(col, col) for col in df.columns]
-
-                required_cols = ['股票代码', '股票名称', '占净值比例', '持仓市值', '季度']
-                missing_cols = [col for col in required_cols if col not in df.columns]
-                if missing_cols:
-                    raise KeyError(f"缺少关键列 {missing_cols}")
-
-                df['占净值比例'] = df['占净值比例'].astype(str).str.replace('%', '', regex=False).str.replace(',', '', regex=False)
-                df['占净值比例'] = pd.to_numeric(df['占净值比例'], errors='coerce')
-                
-                df['持仓市值'] = df['持仓市值'].astype(str).str.replace(',', '', regex=False)
-                df['持仓市值'] = pd.to_numeric(df['持仓市值'], errors='coerce')
-                
-                df['股票代码'] = df['股票代码'].astype(str).str.strip().str.zfill(6)
-                
-                if use_detailed_categories:
-                    df['行业'] = df['股票代码'].map(stock_categories).fillna('未分类')
-                else:
-                    df['行业'] = df['股票代码'].astype(str).str[:3].map(sector_mapping).fillna('未分类')
-                
-                df['基金代码'] = fund_code
-                df_list.append(df)
-            except KeyError as e:
-                print(f"读取文件 {f} 时出错：缺少关键列 {e}")
-                continue
-            except Exception as e:
-                print(f"读取文件 {f} 时出错：{e}")
-                continue
-        
-        if df_list:
-            combined_df = pd.concat(df_list, ignore_index=True)
-            combined_df['季度'] = combined_df['季度'].str.replace('年', '-Q')
-            combined_df['年份'] = combined_df['季度'].str.split('-').str[0].astype(int)
-            combined_df['季度编号'] = combined_df['季度'].str.split('-').str[1].str.replace('季度', '')
-            combined_df.sort_values(by=['年份', '季度编号'], inplace=True)
-            all_funds_df_list.append(combined_df)
-
-    if not all_funds_df_list:
+    # 各基金的数据互不依赖，分发到多个进程并行读取和清洗，结果按原顺序收集
+    # 进程数不超过基金数，避免基金很少时空启动多余进程
+    max_workers = min(len(fund_files), os.cpu_count() or 1, _MAX_POOL_WORKERS)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(load_fund_holdings, fund_code, files, get_fund_cache_path(fund_code, files))
+            for fund_code, files in fund_files.items()
+        ]
+        fund_df_list = [df for df in (future.result() for future in futures) if df is not None]
+
+    if not fund_df_list:
         print("所有基金文件都因错误而跳过，无法生成报告。")
         return
 
-    all_funds_combined_df = pd.concat(all_funds_df_list, ignore_index=True)
+    # 全部基金只拼接一次，季度解析、行业映射和分类类型转换各做一遍，再按基金拆分
+    all_funds_combined_df = process_temporal_data(pd.concat(fund_df_list, ignore_index=True))
+    assign_industry(all_funds_combined_df, stock_categories)
+    # 行业、基金代码取值很少，转为分类类型后分组和筛选比较的是整数编码（季度已在时间处理时转换）
+    for col in ['行业', '基金代码']:
+        all_funds_combined_df[col] = all_funds_combined_df[col].astype('category')
     report = []
 
     # 总览报告部分
-    report.append("# 所有基金持仓总览")
-    report.append("---")
-    report.append("### 整体行业偏好")
+    report.append(OVERVIEW_HEADER)
     
     # 逻辑优化：按季度、行业、基金分组汇总持仓市值，然后按季度和行业汇总
-    overall_sector_fund_summary = all_funds_combined_df.groupby(['季度', '基金代码', '行业'])['持仓市值'].sum().reset_index()
+    overall_sector_fund_summary = all_funds_combined_df.groupby(['季度', '基金代码', '行业'], observed=True)['持仓市值'].sum().reset_index()
 
     # 按季度和行业汇总总市值，用于排序
-    overall_sector_total_summary = overall_sector_fund_summary.groupby(['季度', '行业'])['持仓市值'].sum().sort_values(ascending=False).reset_index()
+    overall_sector_total_summary = overall_sector_fund_summary.groupby(['季度', '行业'], observed=True)['持仓市值'].sum().sort_values(ascending=False).reset_index()
 
-    unique_quarters = all_funds_combined_df['季度'].unique()
+    # 各基金对行业的贡献行一次性整列格式化，按季度和行业分组后供下方循环直接取用
+    fund_contributions = overall_sector_fund_summary.merge(
+        overall_sector_total_summary.rename(columns={'持仓市值': '行业总市值'}), on=['季度', '行业'])
+    fund_contributions = fund_contributions.sort_values('持仓市值', ascending=False, kind='stable')
+    contribution_ratio = (fund_contributions['持仓市值'] / fund_contributions['行业总市值'] * 100).where(
+        fund_contributions['行业总市值'] > 0, 0)
+    contribution_lines = ('  - 基金代码 ' + fund_contributions['基金代码'].astype(str) + '：持仓市值 '
+                          + fund_contributions['持仓市值'].map('{:.2f}'.format) + ' 万元 ('
+                          + contribution_ratio.map('{:.2f}'.format) + '%)')
+    contribution_lines = contribution_lines.groupby(
+        [fund_contributions['季度'], fund_contributions['行业']], observed=True).agg(list)
+
+    # 季度类别即全部出现过的季度，且已按时间先后排列
+    unique_quarters = all_funds_combined_df['季度'].cat.categories
 
     for quarter in unique_quarters:
         report.append(f"\n#### {quarter} 行业持仓总览")
@@ -282,42 +524,34 @@ def analyze_holdings():
         # 获取当前季度市值排名前5的行业
         top_sectors = overall_sector_total_summary[overall_sector_total_summary['季度'] == quarter].head(5)
         
-        for index, row in top_sectors.iterrows():
-            sector = row['行业']
-            total_market_value = row['持仓市值']
-            
+        for sector, total_market_value in zip(top_sectors['行业'], top_sectors['持仓市值']):
             report.append(f"\n- **{sector}**：总持仓市值 **{total_market_value:.2f} 万元**")
-            
-            # 找到所有持有该行业的基金
-            fund_contributions = overall_sector_fund_summary[
-                (overall_sector_fund_summary['季度'] == quarter) & 
-                (overall_sector_fund_summary['行业'] == sector)
-            ].sort_values(by='持仓市值', ascending=False)
-            
-            for _, fund_row in fund_contributions.iterrows():
-                fund_code = fund_row['基金代码']
-                fund_market_value = fund_row['持仓市值']
-                contribution_ratio = (fund_market_value / total_market_value) * 100 if total_market_value > 0 else 0
-                report.append(f"  - 基金代码 {fund_code}：持仓市值 {fund_market_value:.2f} 万元 ({contribution_ratio:.2f}%)")
+            # 持有该行业的各基金贡献，已按持仓市值降序排列
+            report.extend(contribution_lines[(quarter, sector)])
     
     # 汇总未分类股票
-    unclassified_overall = all_funds_combined_df[all_funds_combined_df['行业'].str.contains('未分类')]
+    unclassified_overall = all_funds_combined_df[all_funds_combined_df['行业'].str.contains('未分类', regex=False)]
     if not unclassified_overall.empty:
-        report.append("\n### 未分类股票列表（按总市值汇总）")
-        report.append("---")
+        report.append(OVERVIEW_UNCLASSIFIED_HEADER)
         unclassified_summary = unclassified_overall.groupby(['股票代码', '股票名称'])['持仓市值'].sum().sort_values(ascending=False).reset_index()
-        report.append(unclassified_summary.to_markdown(index=False))
+        # 直接拼接表格行，避免 to_markdown 依赖 tabulate 逐行格式化
+        rows = ('| ' + unclassified_summary['股票代码'] + ' | ' + unclassified_summary['股票名称'] + ' | '
+                + unclassified_summary['持仓市值'].map('{:.2f}'.format) + ' |')
+        report.append('\n'.join(rows.tolist()))
     
     report.append("\n---")
 
-    # 单基金详细报告部分
-    for fund_code in all_funds_combined_df['基金代码'].unique():
-        fund_df = all_funds_combined_df[all_funds_combined_df['基金代码'] == fund_code].copy()
-        generate_fund_report(fund_df, fund_code, report)
-    
-    with open('analysis_report.md', 'w', encoding='utf-8') as f:
+    # 单基金报告逐个生成并写入文件，避免整份报告驻留内存
+    with open('analysis_report.md', 'w', encoding='utf-8', buffering=1 << 20) as f:
         f.write('\n'.join(report))
 
+        # 单基金详细报告部分：按基金代码逐组取出数据，在本进程内生成一份写一份。
+        # 报告生成远比读取持仓轻，不必再把各基金数据序列化到子进程，也不必缓存已完成的报告
+        for fund_code, fund_df in all_funds_combined_df.groupby('基金代码', sort=False, observed=True):
+            fund_report = generate_fund_report(fund_df, fund_code)
+            f.write('\n')
+            f.write('\n'.join(fund_report))
+
     print("分析报告已生成：analysis_report.md")
 
 if __name__ == "__main__":
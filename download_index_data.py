@@ -1,5 +1,7 @@
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import os
 import logging
@@ -34,6 +36,18 @@ HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36'
 }
 
+# 接口返回体的解析模式，逐页使用，在模块加载时编译一次
+_CONTENT_RE = re.compile(r'content:"(.*?)"', re.S)
+_PAGES_RE = re.compile(r'pages:(\d+)')
+
+# 逐页抓取共用一个会话，复用 HTTP 长连接，避免每页重新建立 TCP 连接。
+# 单页请求遇到连接错误或 429/5xx 时先在连接层退避重试，不必让整个下载从第一页重来
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_ADAPTER = HTTPAdapter(max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]))
+SESSION.mount('http://', _ADAPTER)
+SESSION.mount('https://', _ADAPTER)
+
 def _load_local_data() -> pd.DataFrame:
     """从本地文件加载已有的指数数据"""
     if os.path.exists(OUTPUT_FILE):
@@ -65,7 +79,7 @@ def fetch_and_save_index_data():
         latest_local_date = local_df['date'].max()
         logger.info("本地最新数据日期为: %s", latest_local_date.date())
         
-    all_new_data = []
+    new_chunks = []
     page_index = 1
     
     while True:
@@ -73,11 +87,11 @@ def fetch_and_save_index_data():
         logger.info("正在获取大盘指数 %s 的第 %d 页数据...", INDEX_CODE, page_index)
         
         try:
-            response = requests.get(url, headers=HEADERS, timeout=30)
+            response = SESSION.get(url, timeout=30)
             response.raise_for_status()
             
-            content_match = re.search(r'content:"(.*?)"', response.text, re.S)
-            pages_match = re.search(r'pages:(\d+)', response.text)
+            content_match = _CONTENT_RE.search(response.text)
+            pages_match = _PAGES_RE.search(response.text)
             
             if not content_match or not pages_match:
                 logger.error("API返回内容格式不正确，可能已无数据或接口变更。")
@@ -86,7 +100,7 @@ def fetch_and_save_index_data():
             raw_content_html = content_match.group(1).replace('\\"', '"')
             total_pages = int(pages_match.group(1))
             
-            tables = pd.read_html(StringIO(raw_content_html))
+            tables = pd.read_html(StringIO(raw_content_html), flavor='lxml')
             
             if not tables:
                 logger.warning("在第 %d 页未找到数据表格，爬取结束。", page_index)
@@ -112,23 +126,20 @@ def fetch_and_save_index_data():
                 logger.info("第 %d 页无有效数据，爬取结束。", page_index)
                 break
             
-            # 增量更新逻辑：检查新数据是否已存在于本地
-            has_new_data = False
-            for _, row in df_page.iterrows():
-                if latest_local_date and row['date'] > latest_local_date:
-                    all_new_data.append(row)
-                    has_new_data = True
-                elif latest_local_date and row['date'] <= latest_local_date:
+            # 增量更新逻辑：接口按日期倒序返回，取到第一条本地已有日期之前的行为止，
+            # 整页按列筛选后暂存，循环结束后一次性合并
+            if latest_local_date:
+                reached_local = (df_page['date'] <= latest_local_date).cummax()
+                new_rows = df_page[~reached_local]
+                if not new_rows.empty:
+                    new_chunks.append(new_rows)
+                if reached_local.any():
                     logger.info("已下载到本地最新数据，增量更新完成。")
-                    has_new_data = False
                     break
-                elif not latest_local_date:
-                    # 如果本地没有数据，则全部视为新数据
-                    all_new_data.append(row)
+            else:
+                # 如果本地没有数据，则全部视为新数据
+                new_chunks.append(df_page)
 
-            if not has_new_data and latest_local_date:
-                break
-            
             if page_index >= total_pages:
                 logger.info("已获取所有历史数据，共 %d 页，爬取结束。", total_pages)
                 break
@@ -143,12 +154,9 @@ def fetch_and_save_index_data():
             logger.error("数据解析失败: %s", str(e))
             raise
 
-    if all_new_data:
-        # 将新数据转换为DataFrame
-        new_df = pd.DataFrame(all_new_data)
-        
-        # 合并本地数据和新数据，去重并排序
-        combined_df = pd.concat([local_df, new_df], ignore_index=True)
+    if new_chunks:
+        # 合并本地数据和各页新数据，去重并排序
+        combined_df = pd.concat([local_df, *new_chunks], ignore_index=True)
         combined_df = combined_df.drop_duplicates(subset=['date'], keep='last').sort_values(by='date', ascending=True)
 
         # 保存到本地CSV文件
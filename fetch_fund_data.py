@@ -1,9 +1,14 @@
 import pandas as pd
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 import os
 import time
+import threading
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional, List
 import logging
 from pathlib import Path
@@ -13,15 +18,106 @@ import re
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# FundArchivesDatas.aspx 返回 var apidata={ content:"<html片段>",arryear:[...],curyear:...};
+# 只取出 content 中的 HTML 片段交给表格解析
+_APIDATA_CONTENT_RE = re.compile(r'content:"(.*?)",\s*arryear', re.S)
+_QUARTER_RE = re.compile(r'(\d{4}年\d季度)')
+# 需要转为数值的列（表头中可能夹带空白，匹配时忽略），以及其中的千分位逗号和百分号
+_NUMERIC_COLS = ('占净值比例', '持股数（万股）', '持仓市值（万元）')
+_NUMERIC_NOISE_RE = re.compile(r'[,%]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# 并发抓取的线程数，可通过环境变量 FETCH_MAX_WORKERS 调整
+DEFAULT_MAX_WORKERS = int(os.environ.get('FETCH_MAX_WORKERS', 8))
+# 所有线程合计每秒最多发起的请求数，可通过环境变量 FETCH_REQUESTS_PER_SECOND 调整。
+# 默认 0.5 次/秒，与原先串行抓取每次请求后延时 2 秒避免被封的总速率一致；并发只省去等待响应的空闲时间
+DEFAULT_REQUESTS_PER_SECOND = float(os.environ.get('FETCH_REQUESTS_PER_SECOND', 0.5))
+# 服务端限流（429）、5xx 或读超时时，单个请求最多尝试的次数；每次尝试都先经过限速器
+MAX_FETCH_ATTEMPTS = 3
+
+class RateLimiter:
+    """
+    线程安全的自适应请求限速器：相邻两次请求的开始时间至少间隔当前间隔。
+    服务端限流或出错时间隔加倍（不超过 max_interval），连续成功 recover_after 次后减半，直至回到 1/rate
+    """
+    
+    def __init__(self, rate: float, max_interval: float = 8.0, recover_after: int = 10):
+        self.base_interval = 1.0 / rate
+        self.interval = self.base_interval
+        self.max_interval = max(max_interval, self.base_interval)
+        self.recover_after = recover_after
+        self._successes = 0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+    
+    def wait(self):
+        """预约下一个可用的请求时刻，只在确有必要时休眠到该时刻"""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+    
+    def penalize(self):
+        """服务端限流或出错：加倍请求间隔"""
+        with self._lock:
+            self.interval = min(self.interval * 2, self.max_interval)
+            self._successes = 0
+    
+    def reward(self):
+        """请求成功：累计足够的连续成功后把间隔减半"""
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.recover_after and self.interval > self.base_interval:
+                self.interval = max(self.interval / 2, self.base_interval)
+                self._successes = 0
+
 class FundHoldingsFetcher:
     """基金持仓数据抓取器"""
     
-    def __init__(self, base_url: str = "http://fundf10.eastmoney.com"):
+    def __init__(self, base_url: str = "http://fundf10.eastmoney.com", max_workers: int = DEFAULT_MAX_WORKERS,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND):
         self.base_url = base_url
+        self.max_workers = max_workers
+        # 所有线程共享同一限速器，避免被封的同时不让各线程同步空等
+        self.rate_limiter = RateLimiter(requests_per_second)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         })
+        # 所有请求复用同一连接池中的长连接；连接层只重试尚未到达服务端的建连失败，
+        # 429/5xx 与读超时交给 _get 经限速器重试，避免绕过请求间隔连续打到服务端
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, connect=3, read=0, status=0, other=0, backoff_factor=0.5)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """
+        经限速器发起 GET 请求；服务端限流、出错或读超时时放慢限速器并重试，
+        最多 MAX_FETCH_ATTEMPTS 次，仍失败则抛出最后一次的异常
+        """
+        for attempt in range(1, MAX_FETCH_ATTEMPTS + 1):
+            self.rate_limiter.wait()
+            try:
+                response = self.session.get(url, **kwargs)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                # 429/5xx 或连接失败说明服务端吃紧，放慢后续请求；其它 4xx 与限流无关，不重试
+                status = e.response.status_code if e.response is not None else None
+                if status is not None and status != 429 and status < 500:
+                    raise
+                self.rate_limiter.penalize()
+                if attempt == MAX_FETCH_ATTEMPTS:
+                    raise
+                logger.warning("⚠️ 请求失败，第 %d 次重试: %s", attempt, e)
+                continue
+            self.rate_limiter.reward()
+            return response
     
     def fetch_fund_holdings(self, fund_code: str, year: int) -> Optional[pd.DataFrame]:
         """
@@ -37,21 +133,32 @@ class FundHoldingsFetcher:
         url = f"{self.base_url}/FundArchivesDatas.aspx?type=jjcc&code={fund_code}&topline=10&year={year}"
         
         try:
-            response = self.session.get(url, timeout=15)
-            response.raise_for_status()
+            # 带上持仓明细页作为来源页，与页面内脚本发起的请求一致，减少被接口拒绝的情况
+            response = self._get(url, timeout=15,
+                                 headers={'Referer': f"{self.base_url}/ccmx_{fund_code}.html"})
+            
+            # 去掉 JSONP 外壳，只解析其中的持仓 HTML 片段；格式不符时退回解析整段响应
+            content_match = _APIDATA_CONTENT_RE.search(response.text)
+            content = content_match.group(1) if content_match else response.text
             
             # 使用 StringIO 包装字符串，避免FutureWarning
-            tables = pd.read_html(StringIO(response.text), encoding='utf-8')
+            # 片段结构简单，直接用 lxml 解析，不回退到 bs4/html5lib；
+            # 股票代码在解析时即按字符串读入，既免去类型推断，也保留前导零
+            tables = pd.read_html(StringIO(content), flavor='lxml', encoding='utf-8',
+                                  converters={'股票代码': str})
             
             if not tables:
-                logger.warning(f"⚠️ 基金 {fund_code} 在 {year} 年没有表格数据")
+                logger.warning("⚠️ 基金 %s 在 %s 年没有表格数据", fund_code, year)
                 return None
 
-            full_year_df = pd.DataFrame()
+            # 各季度表格先收集到列表，循环结束后只拼接一次
+            quarter_dfs = []
+            # 片段只切分一次，第 i 段即第 i 个表格上方的文本
+            segments = content.split('<table')
             
             for i, table in enumerate(tables):
                 # 从表格上方的文本中提取季度信息
-                quarter_match = re.search(r'(\d{4}年\d季度)', response.text.split('<table')[i])
+                quarter_match = _QUARTER_RE.search(segments[i])
                 quarter_info = quarter_match.group(1) if quarter_match else f"Q{i+1}"
                 
                 # 数据清洗
@@ -59,20 +166,21 @@ class FundHoldingsFetcher:
                 
                 if not cleaned_df.empty:
                     cleaned_df['季度'] = quarter_info
-                    full_year_df = pd.concat([full_year_df, cleaned_df], ignore_index=True)
+                    quarter_dfs.append(cleaned_df)
             
-            if not full_year_df.empty:
-                logger.info(f"✅ 成功获取基金 {fund_code} 在 {year} 年的全部季度持仓数据，总记录数：{len(full_year_df)}")
+            if quarter_dfs:
+                full_year_df = self._convert_numeric_columns(pd.concat(quarter_dfs, ignore_index=True))
+                logger.info("✅ 成功获取基金 %s 在 %s 年的全部季度持仓数据，总记录数：%d", fund_code, year, len(full_year_df))
                 return full_year_df
             else:
-                logger.warning(f"⚠️ 基金 {fund_code} 在 {year} 年没有有效的持仓数据")
+                logger.warning("⚠️ 基金 %s 在 %s 年没有有效的持仓数据", fund_code, year)
                 return None
                 
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ 网络请求失败 - 基金 {fund_code}, 年份 {year}: {e}")
+            logger.error("❌ 网络请求失败 - 基金 %s, 年份 %s: %s", fund_code, year, e)
             return None
         except Exception as e:
-            logger.error(f"❌ 解析HTML表格或处理数据失败 - 基金 {fund_code}, 年份 {year}: {e}")
+            logger.error("❌ 解析HTML表格或处理数据失败 - 基金 %s, 年份 %s: %s", fund_code, year, e)
             return None
     
     def _clean_holdings_data(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -87,19 +195,18 @@ class FundHoldingsFetcher:
         if not df.columns.empty:
             df.columns = df.columns.str.strip()
         
-        # 转换数值列
-        numeric_cols = ['占净值比例', '持股数（万股）', '持仓市值（万元）']
-        for col in numeric_cols:
-            if col in df.columns:
-                # 移除可能的逗号或百分号
-                df[col] = df[col].astype(str).str.replace(',', '').str.replace('%', '')
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
         # 丢弃无效行
         df = df.dropna(subset=['股票代码', '股票名称'])
         
         return df
     
+    def _convert_numeric_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """在整年各季度合并后，对数值列一次性去除逗号和百分号并转换为数值"""
+        for col in df.columns:
+            if _WHITESPACE_RE.sub('', str(col)) in _NUMERIC_COLS:
+                df[col] = pd.to_numeric(df[col].astype(str).str.replace(_NUMERIC_NOISE_RE, '', regex=True), errors='coerce')
+        return df
+    
     def batch_fetch(self, fund_codes: List[str], years: List[int], 
                     input_file: str, output_dir: str = 'fund_data') -> dict:
         """
@@ -130,29 +237,82 @@ class FundHoldingsFetcher:
         # 确保基金代码格式正确
         fund_codes = [str(code).zfill(6) for code in fund_codes]
         
-        for i, code in enumerate(fund_codes, 1):
-            for year in years:
-                logger.info(f"[{i}/{len(fund_codes)}] 🔍 处理基金 {code} - {year}年")
-                
-                holdings_df = self.fetch_fund_holdings(code, year)
-                
-                if holdings_df is not None and not holdings_df.empty:
-                    # 保存数据
-                    filename = f'持仓_{code}_{year}.csv'
-                    output_path = Path(output_dir) / filename
-                    
-                    holdings_df.to_csv(output_path, index=False, encoding='utf-8-sig')
-                    logger.info(f"💾 数据已保存: {output_path}")
-                    results['success'] += 1
-                else:
-                    results['failed'] += 1
-                
-                # 延时避免被封
-                time.sleep(2)
+        # 各基金、年份的请求互不依赖，由线程池并发执行；并发数受 max_workers 限制
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_task = {
+                executor.submit(self._fetch_and_save, code, year, output_dir, f"[{i}/{len(fund_codes)}]"): (code, year)
+                for i, code in enumerate(fund_codes, 1)
+                for year in years
+            }
+            for future in as_completed(future_to_task):
+                code, year = future_to_task[future]
+                try:
+                    saved = future.result()
+                except Exception as e:
+                    logger.error("❌ 处理基金 %s - %s年时发生异常: %s", code, year, e)
+                    saved = False
+                results['success' if saved else 'failed'] += 1
         
         logger.info(f"🎉 批量抓取完成！成功: {results['success']}, 失败: {results['failed']}")
         return results
 
+    def _fetch_and_save(self, code: str, year: int, output_dir: str, progress: str) -> bool:
+        """
+        抓取单个基金单个年份的持仓并保存为 CSV，供线程池调用
+        
+        Returns:
+            是否成功保存数据
+        """
+        logger.info("%s 🔍 处理基金 %s - %s年", progress, code, year)
+        
+        filename = f'持仓_{code}_{year}.csv'
+        output_path = Path(output_dir) / filename
+        
+        # 已保存的文件包含目前可能披露的最新季度时，不会再有新数据，直接复用已保存的文件
+        if self._has_latest_quarter(output_path, year):
+            logger.info("⏭️ 基金 %s %s年持仓已是最新，跳过抓取", code, year)
+            return True
+        
+        holdings_df = self.fetch_fund_holdings(code, year)
+        saved = holdings_df is not None and not holdings_df.empty
+        
+        if saved:
+            # 保存数据
+            holdings_df.to_csv(output_path, index=False, encoding='utf-8-sig')
+            logger.info("💾 数据已保存: %s", output_path)
+        
+        return saved
+
+    @staticmethod
+    def _has_latest_quarter(output_path: Path, year: int) -> bool:
+        """
+        判断已保存的持仓文件是否已包含该年目前可能披露的最新季度
+        
+        往年为第 4 季度；今年为最近一个已结束的季度（尚未结束的季度不可能有持仓报告）。
+        
+        Args:
+            output_path: 持仓 CSV 路径
+            year: 年份
+            
+        Returns:
+            文件存在且包含该最新季度时返回 True
+        """
+        today = datetime.now()
+        if year < today.year:
+            latest_quarter = 4
+        elif year == today.year:
+            latest_quarter = (today.month - 1) // 3
+        else:
+            latest_quarter = 0
+        if latest_quarter == 0 or not output_path.exists():
+            return False
+        try:
+            quarters = pd.read_csv(output_path, usecols=['季度'], encoding='utf-8-sig')['季度']
+        except Exception as e:
+            logger.warning("⚠️ 读取已保存的持仓文件 %s 失败，将重新抓取: %s", output_path, e)
+            return False
+        return (quarters == f'{year}年{latest_quarter}季度').any()
+
     def analyze_holdings_changes(self, fund_code: str, years: List[int], output_dir: str = 'fund_data', 
                                  analysis_dir: str = 'fund_analysis') -> dict:
         """
@@ -208,12 +368,11 @@ class FundHoldingsFetcher:
             merged[prop_col2] = merged[prop_col2].fillna(0)
             
             merged['比例变化'] = merged[prop_col2] - merged[prop_col1]
-            merged['变化类型'] = merged.apply(
-                lambda row: '新买入' if row[prop_col1] == 0 else 
-                            '卖出' if row[prop_col2] == 0 else 
-                            '增加' if row['比例变化'] > 0 else 
-                            '减少' if row['比例变化'] < 0 else '不变',
-                axis=1
+            # 按列一次性判定变化类型，条件按优先级排列，取第一个成立的
+            merged['变化类型'] = np.select(
+                [merged[prop_col1] == 0, merged[prop_col2] == 0, merged['比例变化'] > 0, merged['比例变化'] < 0],
+                ['新买入', '卖出', '增加', '减少'],
+                default='不变'
             )
             
             # 排序按变化绝对值
@@ -262,7 +421,7 @@ def main():
     today_date = datetime.now().strftime('%Y%m%d')
     input_csv_path = f'data/买入信号基金_{today_date}.csv'
     
-    logger.info(f"🚀 开始执行基金持仓数据抓取任务")
+    logger.info("🚀 开始执行基金持仓数据抓取任务")
     logger.info(f"📅 当前日期: {today_date}")
     
     # 检查输入文件
@@ -3,7 +3,8 @@
 # -*- coding: utf-8 -*-
 import time
 import datetime
-import glob
+import os
+import http.client
 import urllib.request
 import json
 import sys
@@ -11,6 +12,54 @@ import re
 import threading
 import queue
 
+# 净值接口返回的表格行及其中各单元格的解析模式，在模块加载时编译一次
+_TR_RE = re.compile(r'<tr>(.*?)</tr>')
+_ITEM_RE = re.compile(r'''<td>(\d{4}-\d{2}-\d{2})</td><td.*?>(.*?)</td><td.*?>(.*?)</td><td.*?>(.*?)</td><td.*?>(.*?)</td><td.*?>(.*?)</td><td.*?></td>''', re.X)
+
+# 净值接口所在主机；每个工作线程各自保持一个到该主机的长连接，
+# 避免每次查询净值都重新建立 TCP 连接
+JINGZHI_HOST = 'fund.eastmoney.com'
+_thread_local = threading.local()
+# 与 urlopen 默认发送的请求头保持一致
+JINGZHI_HEADERS = {'User-Agent': 'Python-urllib/' + urllib.request.__version__}
+# http.client 不读取 http_proxy 等代理设置：配置了代理时净值请求仍交给 urllib 处理
+JINGZHI_VIA_PROXY = bool(urllib.request.getproxies().get('http')) and not urllib.request.proxy_bypass(JINGZHI_HOST)
+
+# 全部基金列表的地址，以及本地缓存文件和记录缓存校验信息的元数据文件
+FUNDLIST_URL = 'http://fund.eastmoney.com/js/fundcode_search.js'
+FUNDLIST_FILE = 'fundlist.txt'
+FUNDLIST_META_FILE = 'fundlist.json'
+
+# 通过当前线程的长连接 GET 指定路径并返回响应正文
+def http_get(path):
+    url = 'http://' + JINGZHI_HOST + path
+    if JINGZHI_VIA_PROXY:
+        return urllib.request.urlopen(url).read()
+
+    for attempt in range(2):
+        conn = getattr(_thread_local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(JINGZHI_HOST, timeout=15)
+            _thread_local.conn = conn
+        try:
+            conn.request('GET', path, headers=JINGZHI_HEADERS)
+            response = conn.getresponse()
+            body = response.read()
+            break
+        except (http.client.HTTPException, OSError):
+            # 连接可能已被服务端关闭：丢弃后重建连接再试一次
+            conn.close()
+            _thread_local.conn = None
+            if attempt:
+                raise
+
+    if 300 <= response.status < 400:
+        # 发生跳转时交给 urllib 跟随，与原先直接 urlopen 的行为一致
+        return urllib.request.urlopen(url).read()
+    if response.status >= 400:
+        raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+    return body
+
 # 使用方法
 def usage():
     print('fund-rank.py usage:')
@@ -26,9 +75,9 @@ def usage():
 # 获取某一基金在某一日的累计净值数据
 def get_jingzhi(strfundcode, strdate):
     try:
-        url = 'http://fund.eastmoney.com/f10/F10DataApi.aspx?type=lsjz&code=' + \
-              strfundcode + '&page=1&per=20&sdate=' + strdate + '&edate=' + strdate
-        response = urllib.request.urlopen(url)
+        path = '/f10/F10DataApi.aspx?type=lsjz&code=' + \
+               strfundcode + '&page=1&per=20&sdate=' + strdate + '&edate=' + strdate
+        json_fund_value = http_get(path).decode('utf-8')
     except urllib.error.HTTPError as e:
         print(e)
         return '-1'
@@ -36,13 +85,9 @@ def get_jingzhi(strfundcode, strdate):
         print(e)
         return '-1'
 
-    json_fund_value = response.read().decode('utf-8')
-    tr_re = re.compile(r'<tr>(.*?)</tr>')
-    item_re = re.compile(r'''<td>(\d{4}-\d{2}-\d{2})</td><td.*?>(.*?)</td><td.*?>(.*?)</td><td.*?>(.*?)</td><td.*?>(.*?)</td><td.*?>(.*?)</td><td.*?></td>''', re.X)
-
     jingzhi = '-1'
-    for line in tr_re.findall(json_fund_value):
-        match = item_re.match(line)
+    for line in _TR_RE.findall(json_fund_value):
+        match = _ITEM_RE.match(line)
         if match:
             entry = match.groups()
             jingzhi1 = entry[1]
@@ -59,6 +104,51 @@ def get_jingzhi(strfundcode, strdate):
 
     return jingzhi
     
+# 先写临时文件再原子替换，进程中途被终止也不会留下写了一半的缓存文件
+def write_file_atomic(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file_object:
+        file_object.write(text)
+    os.replace(tmp_path, path)
+
+# 获取全部基金列表（fundcode_search.js）
+# 当天已下载过则直接读取本地缓存；否则带上次响应的 ETag/Last-Modified 做条件请求，
+# 服务端返回 304 未修改时沿用本地缓存，不再重复下载整份列表
+def load_fundlist(strtoday):
+    meta = {}
+    if os.path.exists(FUNDLIST_FILE) and os.path.exists(FUNDLIST_META_FILE):
+        try:
+            with open(FUNDLIST_META_FILE, 'r', encoding='utf-8') as file_object:
+                meta = json.load(file_object)
+            if meta.get('date') == strtoday:
+                with open(FUNDLIST_FILE, 'r', encoding='utf-8') as file_object:
+                    return file_object.read()
+        except (ValueError, OSError, AttributeError) as e:
+            # 缓存损坏时当作没有缓存，直接重新下载
+            print(e)
+            meta = {}
+
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(FUNDLIST_URL, headers=headers))
+        all_funds_txt = response.read().decode('utf-8')
+        write_file_atomic(FUNDLIST_FILE, all_funds_txt)
+        meta = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        with open(FUNDLIST_FILE, 'r', encoding='utf-8') as file_object:
+            all_funds_txt = file_object.read()
+
+    meta['date'] = strtoday
+    write_file_atomic(FUNDLIST_META_FILE, json.dumps(meta))
+    return all_funds_txt
+
 # --- 新增的线程工作函数 ---
 def worker(q, strsdate, stredate, result_queue):
     while not q.empty():
@@ -137,32 +227,15 @@ def main(argv):
         print(jingzhimin + '\t\t' + jingzhimax + '\t\t' + str(jingzhidif) + '\t' + str(jingzhirise) + '%')
         sys.exit(0)
         
-    fundlist_files = glob.glob('fundlist-*.txt')
-    if (len(fundlist_files) > 0):
-        file_object = open(fundlist_files[0], 'r')
-        try:
-            all_funds_txt = file_object.read()
-        finally:
-            file_object.close()
-    else:
-        response_all_funds = urllib.request.urlopen('http://fund.eastmoney.com/js/fundcode_search.js')
-        all_funds_txt = response_all_funds.read().decode('utf-8')
-        file_object = open('fundlist-' + strtoday + '.txt', 'w')
-        try:
-            file_object.write(all_funds_txt)
-        finally:
-            file_object.close()
+    all_funds_txt = load_fundlist(strtoday)
     
     all_funds_txt = all_funds_txt[all_funds_txt.find('=')+2:all_funds_txt.rfind(';')]
     all_funds_list = json.loads(all_funds_txt)
     
     print('筛选中，只处理场外C类基金...')
-    c_funds_list = []
-    for fund in all_funds_list:
-        if fund[0].endswith('C') or 'C' in fund[2] or ('C' in fund[3] and '场外' in fund[3]):
-            c_funds_list.append(fund)
-    
-    all_funds_list = c_funds_list
+    # 一次列表推导完成筛选，省去逐条 append 的方法查找和调用
+    all_funds_list = [fund for fund in all_funds_list
+                      if fund[0].endswith('C') or 'C' in fund[2] or ('C' in fund[3] and '场外' in fund[3])]
     print('筛选后，场外C类基金数量：' + str(len(all_funds_list)))
      
     print('start:')
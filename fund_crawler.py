@@ -1,8 +1,10 @@
 import pandas as pd
 import numpy as np
+import csv
 import os
-import re
 from datetime import datetime
+from io import StringIO
+from itertools import takewhile
 
 # 检查并导入所需的库
 try:
@@ -36,83 +38,59 @@ class MarketMonitorParser:
             content = f.read()
 
         print("📖 解析 Markdown 表格...")
-        
-        # 匹配包含"基金代码"和"行动信号"的表格
-        table_pattern = r'(?s).*?\|.*?基金代码.*?\|.*?\|.*?\|.*?\|.*?\|.*?\|.*?行动信号.*?\|.*?(?=\n\n|\Z)'
-        table_match = re.search(table_pattern, content)
+        lines = [line.strip() for line in content.split('\n')]
 
-        if not table_match:
-            print("❌ 正则匹配失败，尝试逐行解析...")
-            lines = content.split('\n')
-            in_table = False
-            table_lines = []
-            for line in lines:
-                line = line.strip()
-                if line.startswith('|') and '基金代码' in line and '行动信号' in line:
-                    in_table = True
-                    table_lines = [line]
-                    continue
-                if in_table:
-                    if line.startswith('|') and len(line.split('|')) >= 8:
-                        table_lines.append(line)
-                    elif not line.strip() and len(table_lines) > 1:
-                        in_table = False
-            
-            if table_lines:
-                print(f"✅ 找到 {len(table_lines) - 2} 条表格数据")
-                return self._parse_table_lines(table_lines)
-            else:
-                print("❌ 未找到包含买入信号的表格")
-                return []
-
-        table_content = table_match.group(0)
-        lines = [line.strip() for line in table_content.split('\n') if line.strip()]
-        
-        header_line_index = -1
-        for i, line in enumerate(lines):
-            if line.startswith('|') and '基金代码' in line and '行动信号' in line:
-                header_line_index = i
-                break
-
-        if header_line_index == -1:
-            print("❌ 未找到表头行")
+        # 定位同时包含"基金代码"和"行动信号"的表头行，表格延续到第一个非表格行为止
+        header_line_index = next((i for i, line in enumerate(lines)
+                                  if line.startswith('|') and '基金代码' in line and '行动信号' in line), None)
+        if header_line_index is None:
+            print("❌ 未找到包含买入信号的表格")
             return []
-            
-        print(f"✅ 找到 {len(lines) - 2} 条表格数据")
-        return self._parse_table_lines(lines[header_line_index:])
+
+        table_lines = list(takewhile(lambda line: line.startswith('|'), lines[header_line_index:]))
+        print(f"✅ 找到 {len(table_lines) - 2} 条表格数据")
+        return self._parse_table_lines(table_lines)
 
     def _parse_table_lines(self, table_lines):
         """
         内部方法：从表格行中解析出基金代码和行动信号。
+        数据行整体交给 pandas 的 C 解析器按 '|' 切分，再按列向量化筛选。
         """
-        buy_signals = []
         data_start = 2 if len(table_lines) > 2 and '|---' in table_lines[1] else 1
-        
-        for i, line in enumerate(table_lines[data_start:], data_start):
-            if not line.startswith('|'):
-                continue
-            
-            parts = [part.strip() for part in line.split('|')]
-            cells = [part for part in parts[1:-1]]
-            
-            if len(cells) < 8:
-                continue
-            
-            fund_code = cells[0].strip()
-            action_signal = cells[-1].strip()
-            
-            if re.match(r'^\d{6}$', fund_code) and '买入' in action_signal:
-                buy_signals.append({
-                    'fund_code': fund_code,
-                    '最新净值': cells[1].strip(),
-                    'RSI': cells[2].strip(),
-                    '净值/MA50': cells[3].strip(),
-                    'MACD信号': cells[4].strip(),
-                    '布林带位置': cells[5].strip(),
-                    '投资建议': cells[6].strip(),
-                    '行动信号': action_signal
-                })
-                
+        data_lines = table_lines[data_start:]
+        if not data_lines:
+            print("📊 最终结果: 0 只买入信号基金")
+            return []
+
+        # 各行宽度可能不一：按最宽的行给出列名，C 解析器会把较短的行补成空串而不会丢弃较宽的行。
+        # 第 k 个 '|' 之前是第 k 个字段，因此每行最后一个单元格位于第 (该行 '|' 数 - 1) 列
+        lines = pd.Series(data_lines)
+        pipe_counts = lines.str.count(r'\|').to_numpy()
+        if pipe_counts.max() - 1 < 8:
+            print("📊 最终结果: 0 只买入信号基金")
+            return []
+        table = pd.read_csv(StringIO('\n'.join(data_lines)), sep='|', header=None, names=range(pipe_counts.max() + 1),
+                            dtype=str, engine='c', na_filter=False, quoting=csv.QUOTE_NONE)
+        cells = table.apply(lambda col: col.str.strip())
+
+        # 与逐行解析时一致：单元格不足 8 个的行跳过，行动信号取该行最后一个单元格
+        fund_codes = cells[1]
+        action_signals = pd.Series(cells.to_numpy()[np.arange(len(cells)), pipe_counts - 1], index=cells.index)
+        mask = ((pipe_counts - 1) >= 8) & fund_codes.str.fullmatch(r'\d{6}') & action_signals.str.contains('买入', regex=False)
+        selected = cells[mask]
+        selected_signals = action_signals[mask]
+
+        buy_signals = pd.DataFrame({
+            'fund_code': selected[1],
+            '最新净值': selected[2],
+            'RSI': selected[3],
+            '净值/MA50': selected[4],
+            'MACD信号': selected[5],
+            '布林带位置': selected[6],
+            '投资建议': selected[7],
+            '行动信号': selected_signals,
+        }).to_dict('records')
+
         print(f"📊 最终结果: {len(buy_signals)} 只买入信号基金")
         return buy_signals
 
@@ -10,8 +10,10 @@ from datetime import date, datetime, timedelta
 import logging
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tenacity import retry, stop_after_attempt, wait_fixed, after_log
-from io import BytesIO
+from io import BytesIO, StringIO
 
 # 配置日志
 logging.basicConfig(
@@ -29,6 +31,13 @@ REPORT_FILE = os.path.join(BASE_DIR, 'analysis_report.md')
 HOLIDAYS_FILE = os.path.join(BASE_DIR, 'holidays.txt')
 HOLIDAYS_URL = "http://www.szse.cn/api/report/ShowReport?SHOWTYPE=xlsx&CATALOGID=1803&tab1PAGENO=1&tab1PAGECOUNT=50&tab1CATEGORY=1073&tab1KEYWORD=%E4%BC%91%E5%B8%82&tab1CURPAGE=1&random=0.291775794770026"
 
+# 净值接口返回体的解析模式，每页每只基金都会用到，在模块加载时编译一次
+_CONTENT_RE = re.compile(r'content:"(.*?)",records', re.DOTALL)
+_RECORDS_RE = re.compile(r'records:(\d+)')
+_PAGES_RE = re.compile(r'pages:(\d+)')
+# 报告中的基金代码块，同样预先编译
+_FUND_CODES_BLOCK_RE = re.compile(r"```python\s*funds = \[(.*?)\]\s*```", re.DOTALL)
+
 # 确保数据目录存在
 os.makedirs(FUND_DATA_DIR, exist_ok=True)
 
@@ -49,6 +58,10 @@ class MarketMonitor:
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        # 连接层对连接错误和 429/5xx 自动退避重试，大盘、节假日等未加 @retry 的请求同样受益
+        adapter = HTTPAdapter(max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.fund_codes = self._get_fund_codes_from_report()
         self.sh_index_data = self._get_sh_index_data()
         self.filter_mode = filter_mode
@@ -64,7 +77,7 @@ class MarketMonitor:
             with open(REPORT_FILE, 'r', encoding='utf-8') as f:
                 content = f.read()
             # 使用正则表达式匹配代码块中的基金代码
-            matches = re.findall(r"```python\s*funds = \[(.*?)\]\s*```", content, re.DOTALL)
+            matches = _FUND_CODES_BLOCK_RE.findall(content)
             if matches:
                 codes = matches[0].replace("'", "").replace('"', "").replace(" ", "").split(',')
                 logging.info(f"从报告中成功提取 {len(codes)} 个基金代码。")
@@ -116,20 +129,19 @@ class MarketMonitor:
         获取沪深300指数数据。
         """
         try:
-            url = "http://push2.eastmoney.com/api/qt/stock/kline/get?cb=jQuery112404095400977226164_1625463137537&secid=1.000300&ut=fa5fd1943c7112009228b3f17d721a71&fields1=f1%2Cf2%2Cf3%2Cf4%2Cf5&fields2=f51%2Cf52%2Cf53%2Cf54%2Cf55%2Cf56%2Cf57%2Cf58%2Cf59%2Cf60%2Cf61&klt=101&fqt=1&end=20500101&lmt=120"
+            # 不带 cb 参数时接口直接返回 JSON，无需剥离 JSONP 外壳再解析
+            url = "http://push2.eastmoney.com/api/qt/stock/kline/get?secid=1.000300&ut=fa5fd1943c7112009228b3f17d721a71&fields1=f1%2Cf2%2Cf3%2Cf4%2Cf5&fields2=f51%2Cf52%2Cf53%2Cf54%2Cf55%2Cf56%2Cf57%2Cf58%2Cf59%2Cf60%2Cf61&klt=101&fqt=1&end=20500101&lmt=120"
             response = self.session.get(url, timeout=10)
-            match = re.search(r'\(({.*?})\)', response.text)
-            
-            if not match:
-                raise ValueError("无法解析指数数据。")
+            response.raise_for_status()
+            parsed_data = response.json()
             
-            parsed_data = eval(match.group(1))
-            if not parsed_data['data'] or not parsed_data['data']['klines']:
+            if not parsed_data.get('data') or not parsed_data['data'].get('klines'):
                 logging.warning("大盘数据API返回数据为空。")
                 return pd.DataFrame()
             
-            data = pd.DataFrame(parsed_data['data']['klines']).iloc[::-1]
-            data.columns = ['date', 'open', 'close', 'high', 'low', 'volume', 'turnover', 'amplitude', 'change_percent', 'change_amount']
+            # 每条 K 线是按 fields2（f51~f61）顺序以逗号拼接的字符串，整列一次切分；接口已按日期升序返回
+            data = pd.Series(parsed_data['data']['klines']).str.split(',', expand=True)
+            data.columns = ['date', 'open', 'close', 'high', 'low', 'volume', 'turnover', 'amplitude', 'change_percent', 'change_amount', 'turnover_rate']
             data['date'] = pd.to_datetime(data['date']).dt.date
             data['change_percent'] = pd.to_numeric(data['change_percent'])
             return data
@@ -174,15 +186,15 @@ class MarketMonitor:
             response.raise_for_status()
             
             # 使用正则表达式提取包含数据的字符串
-            match = re.search(r'content:"(.*?)",records', response.text, re.DOTALL)
+            match = _CONTENT_RE.search(response.text)
             if not match:
-                logging.warning(f"基金 {fund_code} API返回内容为空或格式不正确")
+                logging.warning("基金 %s API返回内容为空或格式不正确", fund_code)
                 return None, 0, 0
             
             html_content = match.group(1).replace('\\"', '"').replace('\\n', '')
             
-            # 使用 pandas 解析 HTML 表格
-            tables = pd.read_html(html_content)
+            # 使用 pandas 的 lxml 解析器解析 HTML 表格，字符串需包装为 StringIO
+            tables = pd.read_html(StringIO(html_content), flavor='lxml')
             if not tables or tables[0].empty:
                 return None, 0, 0
                 
@@ -194,7 +206,7 @@ class MarketMonitor:
                 # 正常七列（股票/混合基金）
                 df.columns = ['date', 'net_value', 'accum_net_value', 'daily_growth', 'purchase_status', 'redemption_status', 'dividend_info']
                 df['net_value'] = pd.to_numeric(df['net_value'], errors='coerce')
-                logging.info(f"基金 {fund_code} API返回7列数据")
+                logging.info("基金 %s API返回7列数据", fund_code)
             elif num_cols == 6:
                 # 修正：处理货币基金返回的6列数据
                 # 头部是 净值日期, 每万份收益, 7日年化收益率（%）, 申购状态, 赎回状态, 分红送配
@@ -203,20 +215,20 @@ class MarketMonitor:
                 df['net_value'] = pd.to_numeric(df['yield_per_10k'], errors='coerce')
                 df['accum_net_value'] = np.nan # 累积净值不存在，设置为NaN
                 df['daily_growth'] = np.nan # 日增长率不存在，设置为NaN
-                logging.warning(f"基金 {fund_code} API返回6列数据，已将 '每万份收益' 作为净值处理。")
+                logging.warning("基金 %s API返回6列数据，已将 '每万份收益' 作为净值处理。", fund_code)
             else:
-                logging.error(f"基金 {fund_code} 返回了未知列数 ({num_cols}) 的数据，跳过。")
+                logging.error("基金 %s 返回了未知列数 (%d) 的数据，跳过。", fund_code, num_cols)
                 return None, 0, 0
                 
             # 提取总记录数和总页数
-            records = int(re.search(r'records:(\d+)', response.text).group(1))
-            pages = int(re.search(r'pages:(\d+)', response.text).group(1))
+            records = int(_RECORDS_RE.search(response.text).group(1))
+            pages = int(_PAGES_RE.search(response.text).group(1))
             
             df['date'] = pd.to_datetime(df['date']).dt.date
             
             return df, records, pages
         except Exception as e:
-            logging.error(f"基金 {fund_code} 在第 {page_index} 页爬取失败: {e}")
+            logging.error("基金 %s 在第 %d 页爬取失败: %s", fund_code, page_index, e)
             return None, 0, 0
 
     def _read_local_data(self, fund_code):
@@ -228,10 +240,10 @@ class MarketMonitor:
             try:
                 df = pd.read_csv(filepath, parse_dates=['date'])
                 df['date'] = df['date'].dt.date
-                logging.info(f"成功读取基金 {fund_code} 的本地缓存数据。")
+                logging.info("成功读取基金 %s 的本地缓存数据。", fund_code)
                 return df
             except Exception as e:
-                logging.warning(f"读取基金 {fund_code} 本地缓存文件失败: {e}")
+                logging.warning("读取基金 %s 本地缓存文件失败: %s", fund_code, e)
         return pd.DataFrame()
 
     def _save_to_local_file(self, df, fund_code):
@@ -241,9 +253,9 @@ class MarketMonitor:
         filepath = os.path.join(FUND_DATA_DIR, f"{fund_code}.csv")
         try:
             df.to_csv(filepath, index=False, encoding='utf-8-sig')
-            logging.info(f"成功将基金 {fund_code} 数据保存到本地。")
+            logging.info("成功将基金 %s 数据保存到本地。", fund_code)
         except Exception as e:
-            logging.error(f"保存基金 {fund_code} 数据到本地失败: {e}")
+            logging.error("保存基金 %s 数据到本地失败: %s", fund_code, e)
 
     def _calculate_indicators(self, df):
         """
@@ -350,7 +362,7 @@ class MarketMonitor:
         """
         处理单个基金的数据：读取本地、增量更新、计算指标并生成信号。
         """
-        logging.info(f"--- 正在处理基金 {fund_code} ---")
+        logging.info("--- 正在处理基金 %s ---", fund_code)
         
         local_df = self._read_local_data(fund_code)
         
@@ -360,39 +372,35 @@ class MarketMonitor:
         
         # 检查是否已是最新，并考虑节假日
         if not local_df.empty and local_df['date'].max() == latest_data_date and str(latest_data_date) not in self.holidays:
-            logging.info(f"基金 {fund_code} 数据已是最新，跳过下载。")
+            logging.info("基金 %s 数据已是最新，跳过下载。", fund_code)
             df = local_df
         else:
-            # 增量下载新数据
-            new_df = pd.DataFrame()
+            # 增量下载新数据：各页结果先收集到列表，结束后只拼接一次
+            new_chunks = []
             page_index = 1
             total_pages = 1
             
             while page_index <= total_pages:
                 time_module.sleep(random.uniform(0.5, 1.5))
-                logging.info(f"正在获取基金 {fund_code} 的第 {page_index} 页数据...")
+                logging.info("正在获取基金 %s 的第 %d 页数据...", fund_code, page_index)
                 temp_df, total_records, total_pages = self._fetch_fund_data(fund_code, page_index)
                 
                 if temp_df is None or temp_df.empty:
-                    logging.warning(f"获取基金 {fund_code} 数据时 API 未返回内容。")
+                    logging.warning("获取基金 %s 数据时 API 未返回内容。", fund_code)
                     break
                     
-                # 合并数据
-                if new_df.empty:
-                    new_df = temp_df
-                else:
-                    new_df = pd.concat([new_df, temp_df], ignore_index=True)
+                new_chunks.append(temp_df)
                 
-                # 检查是否已达到本地最新日期，如果已达到则停止下载
-                if not local_df.empty and (new_df['date'] <= start_date).any():
-                    logging.info(f"已下载至本地最新数据，停止爬取。")
+                # 检查是否已达到本地最新日期，如果已达到则停止下载（之前的页已检查过，只需看本页）
+                if not local_df.empty and (temp_df['date'] <= start_date).any():
+                    logging.info("已下载至本地最新数据，停止爬取。")
                     break
                 
                 page_index += 1
             
             # 合并本地和新数据
-            if not new_df.empty:
-                df = pd.concat([local_df, new_df], ignore_index=True)
+            if new_chunks:
+                df = pd.concat([local_df, *new_chunks], ignore_index=True)
                 df.drop_duplicates(subset=['date'], keep='last', inplace=True)
                 df.sort_values(by='date', inplace=True)
                 self._save_to_local_file(df, fund_code)
@@ -400,7 +408,7 @@ class MarketMonitor:
                 df = local_df
 
         if df.empty or df.shape[0] < 50:
-            logging.warning(f"基金 {fund_code} 数据量不足，无法进行技术分析。")
+            logging.warning("基金 %s 数据量不足，无法进行技术分析。", fund_code)
             return None
         
         processed_df = self._calculate_indicators(df)
@@ -428,7 +436,7 @@ class MarketMonitor:
                     if result:
                         fund_signals.append(result)
                 except Exception as exc:
-                    logging.error(f"处理基金 {fund_code} 时发生异常: {exc}")
+                    logging.error("处理基金 %s 时发生异常: %s", fund_code, exc)
         
         return fund_signals
 